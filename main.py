@@ -1,18 +1,53 @@
 #!/usr/bin/env python3
 
-import sys, os
+import sys, os, json
+from threading import Timer
 from src.server import Server
 from src.recommender import Recommender
+from src.tenants import Tenants
+from src.profiler import Profiler
+from src.memory import parse_size
 
 """Creates recommender object, see src/recommender.py for details
 """
+defaults = dict(
+    documents_n = int(os.getenv('RECOMMENDER_DOCS_LIMIT', 2000)),
+    persons_n = int(os.getenv('RECOMMENDER_PERSONS_LIMIT', 2000)),
+    recs_limit = int(os.getenv('RECOMMENDER_RECS_LIMIT', 5)),
+    device = os.getenv('RECOMMENDER_TORCH_DEVICE', 'cpu')
+)
 recommender = Recommender(
-    int(os.getenv('RECOMMENDER_DOCS_LIMIT', 2000)),
-    int(os.getenv('RECOMMENDER_PERSONS_LIMIT', 2000)),
-    int(os.getenv('RECOMMENDER_RECS_LIMIT', 5)),
-    os.getenv('RECOMMENDER_TORCH_DEVICE', 'cpu')
+    train_workers = int(os.getenv('RECOMMENDER_TRAIN_WORKERS', 0)),
+    memory_budget = parse_size(os.getenv('RECOMMENDER_MEMORY_BUDGET')) if os.getenv('RECOMMENDER_MEMORY_BUDGET') else None,
+    **defaults
 )
 
+"""Tenants are configured in a JSON file RECOMMENDER_TENANTS points to:
+    {"tenant": {"documents_n": 5000, "persons_n": 10000}, ...}
+    limits that aren't configured are the same as the defaults above
+    see src/tenants.py for details
+"""
+tenants_config = {}
+if os.getenv('RECOMMENDER_TENANTS'):
+    with open(os.getenv('RECOMMENDER_TENANTS')) as fh:
+        tenants_config = json.load(fh)
+
+def create_tenant(name):
+    if 'memory_budget' in tenants_config[name]:
+        # RSS is shared by all of the tenants, see Recommender.fit_memory_budget()
+        raise ValueError('memory_budget is not supported for tenants')
+    if tenants_config[name].get('train_workers', 0) > 0:
+        # tenants share the training thread, see src/tenants.py
+        raise ValueError('train_workers is not supported for tenants')
+    kwargs = dict(defaults, **tenants_config[name])
+    return Recommender(metrics_prefix = 'recomlive.tenants.' + name, **kwargs)
+
+tenants = Tenants(create_tenant, int(os.getenv('RECOMMENDER_TENANTS_RESIDENT', 10)))
+
+"""Runtime profilers controlled by admin requests, see src/profiler.py for details
+"""
+profiler = Profiler()
+
 def dispatcher(server, data, response):
     """Parses request data, calls response() callback
     when there's response expected
@@ -24,13 +59,20 @@ def dispatcher(server, data, response):
             sends bytes back to the client
     """
 
+    expire_profiles()
     try:
         """Simple text protocol includes:
             method (str): one of RECR, RECM, RR or PH
             did (str): arbitrary document ID
             pid (str): arbitrary person ID
+            tenant (str): optional, a tenant name,
+                the default recommender is used when it's omitted
         """
-        method, did, pid = data.decode('ascii').split(',')
+        fields = data.decode('ascii').split(',')
+        if len(fields) == 3:
+            fields.append('')
+        method, did, pid, tenant = fields
+        recommender = recommender_of(tenant)
 
         if method == 'RECR':
             """Records a visit: person pid visited document did
@@ -65,13 +107,133 @@ def dispatcher(server, data, response):
     except:
         response(pack_response('BADMSG'))
 
+def admin_dispatcher(server, data, response):
+    """Same as dispatcher() but for admin requests, these are
+    only accepted on the admin port which listens on loopback
+
+    Args: see dispatcher()
+    """
+
+    expire_profiles()
+    try:
+        """Admin protocol includes:
+            method (str): one of PROF, PROFSTOP, PROFEXPIRE or MEM
+            kind (str): one of cprofile, sample, tracemalloc or torch
+                (for MEM it's either empty or graphite)
+            arg (str): number of seconds to profile for (PROF only)
+                or a resident tenant name (MEM only, empty for the default recommender,
+                * for the default recommender and all resident tenants)
+        """
+        method, kind, arg = data.decode('ascii').split(',')
+
+        if method == 'PROF':
+            """Starts a profiler of a kind for arg seconds
+            """
+            seconds = float(arg or 60)
+            profiler.start(kind, seconds)
+            # with no traffic there would be no request to expire the profile
+            # so the deadline itself queues one
+            timer = Timer(seconds, server.dispatch_admin, (b'PROFEXPIRE,,', lambda rdata: None))
+            timer.daemon = True
+            timer.start()
+            response(pack_response('OK'))
+
+        elif method == 'PROFSTOP':
+            """Stops a profiler of a kind before its time is up,
+                returns a path to the file written
+            """
+            path = profiler.stop(kind)
+            response(pack_response('OK', [path]))
+
+        elif method == 'PROFEXPIRE':
+            """Does nothing but expire_profiles() above, queued by deadline timers
+            """
+            response(pack_response('OK'))
+
+        elif method == 'MEM':
+            """Returns bytes used by the recommender components
+                as a list of name=bytes, sends them to graphite as well
+                if kind is graphite
+            """
+            # tenants are looked up among resident ones only, a report
+            # should neither swap them in nor change their LRU order
+            if arg == '*':
+                recommenders = [recommender] + list(tenants.resident.values())
+            elif arg:
+                recommenders = [tenants.resident[arg]]
+            else:
+                recommenders = [recommender]
+            usage = {}
+            for rec in recommenders:
+                if kind == 'graphite':
+                    rec_usage = rec.report_memory()
+                else:
+                    rec_usage = rec.memory_usage()
+                for k, v in rec_usage.items():
+                    usage[k] = usage.get(k, 0) + v
+            # every recommender reports the same process RSS
+            usage['rss'] = rec_usage['rss']
+            response(pack_response('OK', ['{}={}'.format(k, v) for k, v in usage.items()]))
+
+        else:
+            raise Exception
+    except Exception as e:
+        print('Bad admin request:', e)
+        response(pack_response('BADMSG'))
+
+def recommender_of(tenant):
+    return tenants.get(tenant) if tenant else recommender
+
+def expire_profiles():
+    # Profilers are checked on every request
+    # since they have to be stopped by the dispatcher thread
+    for path in profiler.expire():
+        print('Profile written:', path)
+
+def startup(server):
+    """Runs in the daemon process before any thread is started
+    Hogwild workers have to be forked before this process runs autograd
+    """
+    if recommender.trainer is not None:
+        recommender.trainer.start()
+
+def shutdown(server):
+    """Runs once the dispatcher thread is done
+    """
+    if recommender.trainer is not None:
+        recommender.trainer.stop()
+
+def periodic(server):
+    """Runs in its own thread every RECOMMENDER_MEMORY_REPORT_PERIOD seconds
+    the report is queued rather than made right here because caches
+    may only be walked through by the dispatcher thread
+    """
+    if not server.running:
+        return
+    if recommender.trainer is not None:
+        recommender.trainer.check()
+    server.dispatch_admin(b'MEM,graphite,*', lambda rdata: None)
+
 def pack_response(status, data = []):
     return bytes(','.join([status] + data), 'ascii')
 
 
 if __name__ == '__main__':
-    """Creates UDP server daemon, see src/server.py for details
+    """Creates UDP (and optionally TCP/Unix socket) server daemon, see src/server.py for details
     """
-    server = Server(dispatcher, port = int(os.getenv('RECOMMENDER_PORT', 25000)))
+    admin_port = os.getenv('RECOMMENDER_ADMIN_PORT')
+    tcp_port = os.getenv('RECOMMENDER_TCP_PORT')
+    server = Server(
+        dispatcher,
+        periodic = periodic,
+        startup = startup,
+        shutdown = shutdown,
+        period = int(os.getenv('RECOMMENDER_MEMORY_REPORT_PERIOD', 60)),
+        port = int(os.getenv('RECOMMENDER_PORT', 25000)),
+        admin_dispatcher = admin_dispatcher,
+        admin_port = int(admin_port) if admin_port else None,
+        tcp_port = int(tcp_port) if tcp_port else None,
+        unix_path = os.getenv('RECOMMENDER_UNIX_SOCKET')
+    )
     server.command(sys.argv[1])
 
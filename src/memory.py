@@ -0,0 +1,103 @@
+from .cache import KEY, VAL
+
+import os, sys, random, resource
+
+"""Memory footprint accounting helpers
+
+Python objects are measured with sys.getsizeof(), which is an estimate
+of what the allocator really holds, but a good enough one for sizing limits.
+"""
+
+def deep_sizeof(obj, seen = None):
+    """Returns bytes used by obj and by everything it refers to,
+        objects listed in seen (a set of id()-s) are skipped and thus
+        shared objects are counted once
+    """
+    if seen is None:
+        seen = set()
+    if obj is None or isinstance(obj, bool) or id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in list(obj.items()):
+            size += deep_sizeof(k, seen) + deep_sizeof(v, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in list(obj):
+            size += deep_sizeof(v, seen)
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(obj.__dict__, seen)
+    return size
+
+def cache_memory(cache, sample_n = 100):
+    """Returns a tuple of bytes used by an ARC cache:
+        index (int): keys, slots and recency lists of cached elements
+        values (int): cached values, estimated from up to sample_n of them
+        ghosts (int): keys and recency lists of evicted elements (b1 and b2)
+
+        It's meant to be cheap enough for the dispatcher thread: no Python
+        code runs per cached element, keys are measured on the same sample
+        as values and ghost keys are taken to be as big as cached ones
+    """
+    cached_n = len(cache.key_map)
+    sample = []
+    if cached_n:
+        sample = random.sample(list(cache.key_map.values()), min(sample_n, cached_n))
+    key_size = sum(sys.getsizeof(el[KEY]) for el in sample) / len(sample) if sample else 0
+
+    index = sys.getsizeof(cache.key_map) + sys.getsizeof(cache.idx_map) + sys.getsizeof(cache.idx_pool)
+    # slots are lists of three elements which are never resized
+    if cache.idx_map:
+        index += len(cache.idx_map) * sys.getsizeof(cache.idx_map[0])
+    index += int(cached_n * key_size)
+    index += deque_sizeof(cache.t1) + deque_sizeof(cache.t2)
+
+    values = 0
+    if sample:
+        values = sum(deep_sizeof(el[VAL]) for el in sample) * cached_n // len(sample)
+
+    ghosts = deque_sizeof(cache.b1) + deque_sizeof(cache.b2)
+    ghosts += int((len(cache.b1) + len(cache.b2)) * key_size)
+
+    return index, values, ghosts
+
+def deque_sizeof(deque):
+    return sys.getsizeof(deque) + sys.getsizeof(deque.od)
+
+def rnn_memory(rnn):
+    """Returns a tuple of bytes used by RNN tensors:
+        params (int): weights of Embedding, GRU and Linear layers
+        grads (int): gradients, these show up after the first fit()
+        optim (int): optimizer state, i.e. Adagrad sums of squared gradients
+    """
+    tensor_sizeof = lambda t: t.numel() * t.element_size()
+    params = grads = optim = 0
+    for p in rnn.parameters():
+        params += tensor_sizeof(p)
+        if p.grad is not None:
+            grads += tensor_sizeof(p.grad)
+    for state in rnn.optim.state.values():
+        for v in state.values():
+            if hasattr(v, 'element_size'):
+                optim += tensor_sizeof(v)
+    return params, grads, optim
+
+def rss():
+    """Returns current resident set size of the process in bytes
+    """
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # not Linux, peak RSS is the best we can do
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def parse_size(size):
+    """Parses a number of bytes with an optional K, M or G suffix
+    """
+    size = str(size).strip().upper()
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
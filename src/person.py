@@ -0,0 +1,37 @@
+from .cache import Deque
+
+class Person():
+    """Person class implements the browsing history management
+        As well as keeps track of what document pairs have been passed through RNN
+    """
+    def __init__(self, pid, history_max_length):
+        self.id = pid
+
+        # In the history, key is a document_id and value is a Boolean value
+        # of whether or not this document_id has been fed into RNN as an input
+        self.history = Deque()
+        self.history_max_length = history_max_length
+        self.prev_recs = set()
+
+    def append_history(self, document_id):
+        if len(self.history) == self.history_max_length:
+            self.history.pop()
+        if len(self.history) == 0 or self.history[-1][0] != document_id:
+            self.history.appendleft(document_id, False)
+
+    def unlearned_docs(self):
+        doc_ids = []
+        for doc_id in self.history:
+            if self.history.od[doc_id]:
+                break
+            doc_ids.append(doc_id)
+        return doc_ids
+
+    def mark_learned(self, doc_ids):
+        # Marking all but the latest document_id
+        # NOTE that document_id-s are stored in the reversed order
+        for doc_id in doc_ids[1:]:
+            if doc_id in self.history:
+                self.history.od[doc_id] = True
+
+
@@ -0,0 +1,155 @@
+from collections import Counter
+from threading import Thread, Event, get_ident
+
+import cProfile, tracemalloc, os, sys, time
+
+class Profiler(object):
+    """Runtime profiling of a live process
+
+        Every profiler kind is started for a number of seconds and is stopped
+        either explicitly or by expire() once that number of seconds has passed,
+        the results are written into a file under outdir:
+            cprofile (.prof): deterministic cProfile stats of the calling thread,
+                load them with pstats or snakeviz
+            sample (.folded): stacks of the calling thread sampled every
+                sample_interval seconds by a background thread, the output is
+                in the collapsed format that flamegraph.pl understands
+            tracemalloc (.txt): top memory allocations by source line
+            torch (.json): torch profiler trace of RNN.fit()/RNN.predict(),
+                open it in chrome://tracing
+
+        cprofile, sample and torch profile the thread that calls start()
+        therefore start(), stop() and expire() are supposed to be called
+        from the dispatcher thread, the one that runs the hot path.
+        NOTE that RNN.fit() is only captured when it's run by the dispatcher
+        thread, i.e. it isn't when training is offloaded to Hogwild workers
+        (train_workers, see src/trainer.py) or to the tenants' training thread
+        (see src/tenants.py); RNN.predict() is always captured.
+    """
+
+    def __init__(self, outdir = 'var/prof', sample_interval = 0.005, tracemalloc_top = 100):
+        self.outdir             = outdir
+        self.sample_interval    = sample_interval
+        self.tracemalloc_top    = tracemalloc_top
+        # kind -> (deadline, state)
+        self.active             = {}
+
+    def start(self, kind, seconds):
+        if kind in self.active:
+            raise Exception('Already profiling: {}'.format(kind))
+        method = getattr(self, '_start_' + str(kind), self._unknown_kind)
+        self.active[kind] = (time.time() + seconds, method())
+
+    def stop(self, kind):
+        if kind not in self.active:
+            raise Exception('Not profiling: {}'.format(kind))
+        _, state = self.active.pop(kind)
+        if not os.path.isdir(self.outdir):
+            os.makedirs(self.outdir)
+        return getattr(self, '_stop_' + kind)(state)
+
+    def expire(self):
+        """Stops every profiler whose time is up
+
+            Returns a list of paths to the files written
+        """
+        now = time.time()
+        paths = []
+        for kind, (deadline, _) in list(self.active.items()):
+            if deadline <= now:
+                paths.append(self.stop(kind))
+        return paths
+
+    def _path(self, kind, ext):
+        return os.path.join(self.outdir, '{}-{}.{}'.format(
+            kind, time.strftime('%Y%m%d-%H%M%S'), ext))
+
+    def _unknown_kind(self):
+        raise ValueError('Unknown profiler kind')
+
+    def _start_cprofile(self):
+        prof = cProfile.Profile()
+        prof.enable()
+        return prof
+
+    def _stop_cprofile(self, prof):
+        prof.disable()
+        path = self._path('cprofile', 'prof')
+        prof.dump_stats(path)
+        return path
+
+    def _start_sample(self):
+        sampler = Sampler(self.sample_interval)
+        sampler.start()
+        return sampler
+
+    def _stop_sample(self, sampler):
+        sampler.stop()
+        path = self._path('sample', 'folded')
+        with open(path, 'w') as fh:
+            for stack, count in sampler.stacks.most_common():
+                fh.write('{} {}\n'.format(stack, count))
+        return path
+
+    def _start_tracemalloc(self):
+        tracemalloc.start()
+
+    def _stop_tracemalloc(self, _):
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        path = self._path('tracemalloc', 'txt')
+        with open(path, 'w') as fh:
+            for stat in snapshot.statistics('lineno')[:self.tracemalloc_top]:
+                fh.write('{}\n'.format(stat))
+        return path
+
+    def _start_torch(self):
+        import torch
+        prof = torch.profiler.profile(
+            activities = [torch.profiler.ProfilerActivity.CPU],
+            record_shapes = True
+        )
+        prof.start()
+        return prof
+
+    def _stop_torch(self, prof):
+        prof.stop()
+        path = self._path('torch', 'json')
+        prof.export_chrome_trace(path)
+        return path
+
+
+class Sampler(object):
+    """Low-overhead statistical profiler
+
+        A background thread takes a stack of the thread that has created
+        the sampler every interval seconds and counts identical stacks
+    """
+
+    def __init__(self, interval):
+        self.interval   = interval
+        self.ident      = None
+        self.stacks     = Counter()
+        self.stopped    = Event()
+        self.thread     = Thread(target = self._sample, daemon = True)
+
+    def start(self):
+        self.ident = get_ident()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(
+                    code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
@@ -1,6 +1,12 @@
 from .cache import Cache, Deque
 from .graphite import Graphite
+from .memory import deep_sizeof, deque_sizeof, cache_memory, rnn_memory, rss
+from .person import Person
 from .rnn import RNN
+from .sketch import Trending
+from .trainer import Trainer
+
+import sys
 """The core module responsible for:
     * keeping track of person/document visits
     * learning from it
@@ -15,20 +21,32 @@ class Recommender():
             persons_n (int): Maximum number of distinct persons that are kept in memory
             documents_cache (Cache): An instance of ARC cache for documents
             persons_cache (Cache): An instance of ARC cache for persons
+            history_n (int): Maximum length of a person's history
             recs_limit (int): Maximum namber of recommendations that recommend() method returns
             rnn (RNN): Recurrent neural network model that is learnt to map a document
                 to the next document visited by a person
+            trainer (Trainer): parallel training workers or a queue of the training
+                thread shared by tenants (see src/tenants.py), None when RNN is learnt
+                right in record()
+            trending (Trending): popular documents, recommended when RNN has nothing to say
             graphite (Graphite): graphite feeder
+            metrics_prefix (str): prefix of the metrics sent to graphite
 
         The object is supposed to be created once and to be kept in memory of a recommender service
         as long as possible so that RNN can keep on improving.
-        Every instantiation causes a cold-start pit, model persistence isn't supported.
+        Every instantiation causes a cold-start pit, the only kind of persistence supported
+        is pickling, which is what tenants are swapped out to disk with.
 
-        Apart from the attributes listed above, constructor takes one more optional argument:
+        Apart from the attributes listed above, constructor takes more optional arguments:
             device (str): one of 'cuda' or 'cpu', it tells RNN model which device to use
                 set it to 'cuda' if you have an Nvidia GPU available and drivers and cuDNN installed
                 the end-to-end record()/recommend() curcuit when run on GTX 1050 ti works
                 5 times faster than when run on Intel Core i5-4570
+            train_workers (int): number of processes that learn RNN in parallel
+                see src/trainer.py, zero means that record() learns RNN by itself,
+                the workers aren't there until trainer.start() is called
+            memory_budget (int): bytes the process is allowed to take, when set
+                persons_n and history_n are derived from it, see fit_memory_budget()
     """
 
     def __init__(
@@ -36,24 +54,66 @@ class Recommender():
             documents_n      = 2000,
             persons_n        = 2000,
             recs_limit       = 10,
-            device           = 'cpu'
+            device           = 'cpu',
+            train_workers    = 0,
+            memory_budget    = None,
+            metrics_prefix   = 'recomlive'
         ):
 
         self.documents_n     = documents_n
         self.persons_n       = persons_n
-        self.documents_cache = Cache(documents_n)
-        self.persons_cache   = Cache(persons_n)
         self.recs_limit      = recs_limit
 
+        # A little bit of hardcode here stands for maximum person's history length
+        # which is one tenth of the documents limit but not less than ten
+        self.history_n       = max(documents_n // 10, 10)
+
         # embedding dimension and hidded dimension are hardcoded
         # these numbers work well on an entertainment web-site
         # having about 1 million unique visitors per day
         # and about 5 thousand distinct pages that are being visited
         self.rnn             = RNN(documents_n, 320, 128, device)
+        self.train_workers   = train_workers
+        self.metrics_prefix  = metrics_prefix
+        self.trainer         = None
+        if train_workers > 0:
+            self.trainer     = Trainer(self.rnn, train_workers, metrics_prefix = metrics_prefix)
+
+        if memory_budget is not None:
+            # the model is there already, so what's left of the budget goes to persons
+            self.persons_n, self.history_n = self.fit_memory_budget(memory_budget)
+
+        self.documents_cache = Cache(documents_n)
+        self.persons_cache   = Cache(self.persons_n)
+
+        # Ten times more than recommendations in order to
+        # have enough left after filtering out a person's history
+        self.trending        = Trending(max(recs_limit * 10, 50))
 
         self.graphite        = Graphite()
 
 
+    def __getstate__(self):
+        # neither graphite socket nor training workers survive pickling
+        state = self.__dict__.copy()
+        del state['graphite']
+        state['trainer'] = None
+        return state
+
+
+    def __setstate__(self, state):
+        # trainer stays None, i.e. RNN is learnt right in record() unless
+        # the one who loads the object sets a trainer up and starts it
+        self.__dict__.update(state)
+        self.graphite = Graphite()
+
+
+    def send(self, metric, value):
+        """Sends a metric prefixed with metrics_prefix to graphite
+        """
+        self.graphite.send('{}.{}'.format(self.metrics_prefix, metric), value)
+
+
     def person_history(self, person_id):
         """Looks up browsing history given a person_id
 
@@ -74,27 +134,26 @@ class Recommender():
             to the index of the current document
         """
 
-        self.graphite.send('recomlive.record_call.sum', 1)
+        self.send('record_call.sum', 1)
 
         # Documents don't need any data in the cache but their IDs
         # therefore the second argument to get_replace() is None
         doc_res = self.documents_cache.get_replace(document_id, None)
+        self.trending.add(document_id)
         if doc_res.is_hit:
             # This many times another visit hit a known document
             # The ratio of document hits to visits is crucial for the quality
             # of recommendations it should remain above 90%
             # otherwise consider increasing self.documents_n
-            self.graphite.send('recomlive.documents_cache_hit.sum', 1)
+            self.send('documents_cache_hit.sum', 1)
 
         # A person object has to be cached along with person_id
         # this callback creates the object when a person_id is unknown
-        new_prs = lambda: Person(person_id, max(self.documents_n / 10, 10))
-        # A little bit of hardcode above stands for maximum person's history length
-        # which is one tenth of the documents limit but not less than ten
+        new_prs = lambda: Person(person_id, self.history_n)
         prs_res = self.persons_cache.get_replace(person_id, new_prs)
         if prs_res.is_hit:
             # This hit ratio isn't super important but still nice to have an overview of it
-            self.graphite.send('recomlive.persons_cache_hit.sum', 1)
+            self.send('persons_cache_hit.sum', 1)
 
         # By the way, cache.get_replace(id, [data]) will always
         # accommodate an item in the cache, therefore never returns None
@@ -102,7 +161,7 @@ class Recommender():
 
         if document_id in prs_res.value.prev_recs:
             # Yay, a person "clicked" the previous recommendation!
-            self.graphite.send('recomlive.recommendation_hit.sum', 1)
+            self.send('recommendation_hit.sum', 1)
 
         # Let's add the current document_id into a person's history
         # and see if there is something to learn on
@@ -120,11 +179,15 @@ class Recommender():
             if len(inputs) >= 2:
                 # ok, so now we're sure that we have the sequence of at least 2
                 # documents that we can learn on
-                self.graphite.send('recomlive.rnn_learn.sum', 1)
+                self.send('rnn_learn.sum', 1)
 
                 # documents are fed into RNN as a list of their indexes
-                loss = self.rnn.fit(inputs)
-                self.graphite.send('recomlive.rnn_loss.avg', loss)
+                if self.trainer is None:
+                    loss = self.rnn.fit(inputs)
+                    self.send('rnn_loss.avg', loss)
+                elif not self.trainer.put(inputs):
+                    # workers can't keep up with the traffic or aren't started
+                    self.send('rnn_learn_dropped.sum', 1)
 
                 # all but the current document_id is marked as learned
                 prs_res.value.mark_learned(unlearned)
@@ -134,17 +197,12 @@ class Recommender():
         """Makes item-based recommendations given a document_id
             if a person_id is provided then recommendations are filtered
             so that they don't include documents seen by a person
+            if RNN comes up with nothing then trending documents are recommended
 
             Returns a list of zero or more document_id-s
         """
 
-        self.graphite.send('recomlive.recommend_call.sum', 1)
-
-        doc_res = self.documents_cache.get_by_key(document_id)
-        if doc_res is None:
-            # Can't recommend anything for an unknown document
-            self.graphite.send('recomlive.no_recommendations.sum', 1)
-            return []
+        self.send('recommend_call.sum', 1)
 
         history = {}
         prs_res = None
@@ -153,8 +211,11 @@ class Recommender():
             if prs_res is not None:
                 history = prs_res.value.history
 
+        doc_res = self.documents_cache.get_by_key(document_id)
+
         # let's pass the RNN forward
-        r = self.rnn.predict(doc_res.idx)
+        # it can't recommend anything for an unknown document though
+        r = self.rnn.predict(doc_res.idx) if doc_res is not None else []
 
         recs = []
         for i in r:
@@ -177,7 +238,19 @@ class Recommender():
                 break
 
         if len(recs) == 0:
-            self.graphite.send('recomlive.no_recommendations.sum', 1)
+            # nothing from RNN, what's trending is better than nothing
+            # the same filtering applies
+            for rec in self.trending.trending():
+                if rec == document_id or rec in history:
+                    continue
+                recs.append(rec)
+                if len(recs) == self.recs_limit:
+                    break
+            if len(recs) > 0:
+                self.send('trending_recommendations.sum', 1)
+
+        if len(recs) == 0:
+            self.send('no_recommendations.sum', 1)
 
         if prs_res is not None:
             # let's preserve the recommendations in the person object
@@ -188,39 +261,94 @@ class Recommender():
         return recs
 
 
+    def memory_usage(self):
+        """Accounts memory taken by the components of the recommender
 
-class Person():
-    """Person class implements the browsing history management
-        As well as keeps track of what document pairs have been passed through RNN
-    """
-    def __init__(self, pid, history_max_length):
-        self.id = pid
-
-        # In the history, key is a document_id and value is a Boolean value
-        # of whether or not this document_id has been fed into RNN as an input
-        self.history = Deque()
-        self.history_max_length = history_max_length
-        self.prev_recs = set()
-
-    def append_history(self, document_id):
-        if len(self.history) == self.history_max_length:
-            self.history.pop()
-        if len(self.history) == 0 or self.history[-1][0] != document_id:
-            self.history.appendleft(document_id, False)
-
-    def unlearned_docs(self):
-        doc_ids = []
-        for doc_id in self.history:
-            if self.history.od[doc_id]:
-                break
-            doc_ids.append(doc_id)
-        return doc_ids
+            Returns a dict of component name to number of bytes,
+            persons_values is an estimate made on a sample of persons
+        """
+        usage = {}
+        for name, cache in (('documents', self.documents_cache), ('persons', self.persons_cache)):
+            index, values, ghosts = cache_memory(cache)
+            usage[name + '_index'] = index
+            usage[name + '_values'] = values
+            usage[name + '_ghosts'] = ghosts
+        usage['rnn_params'], usage['rnn_grads'], usage['rnn_optim'] = rnn_memory(self.rnn)
+        usage['trending'] = deep_sizeof(self.trending)
+        usage['rss'] = rss()
+        return usage
+
+
+    def report_memory(self):
+        """Sends memory_usage() to graphite, returns it as well
+        """
+        usage = self.memory_usage()
+        for name, size in usage.items():
+            self.send('memory.{}.avg'.format(name), size)
+        return usage
 
-    def mark_learned(self, doc_ids):
-        # Marking all but the latest document_id
-        # NOTE that document_id-s are stored in the reversed order
-        for doc_id in doc_ids[1:]:
-            if doc_id in self.history:
-                self.history.od[doc_id] = True
 
+    def fit_memory_budget(self, memory_budget, id_length = 16, sample_n = 100):
+        """Works out how many persons and how long histories fit into memory_budget
+            Whatever the process takes by now (the interpreter, torch, RNN) is subtracted
+            as well as RNN gradients, the documents cache and the trending table which
+            are yet to come, the rest goes to persons. Per element costs are measured
+            on small caches filled with made up ids of id_length characters.
 
+            The budget is for this process only: Hogwild workers (train_workers) are
+            processes of their own, every one of them takes RNN gradients, its copy
+            of Adagrad state and torch's own memory on top of it. The budget isn't
+            meant for tenants either as the process RSS is shared by all of them.
+
+            History length is kept at self.history_n unless that would leave
+            fewer persons than documents, in that case histories get shorter
+            down to ten documents
+
+            Returns a tuple of (persons_n, history_n)
+        """
+        make_id = lambda i: '{:0{}d}'.format(i, id_length)
+
+        # ARC remembers up to as many evicted keys as it caches
+        ghosts = Deque()
+        for i in range(sample_n):
+            ghosts.appendleft(make_id(i))
+        ghost_size = (deque_sizeof(ghosts) + sum(map(sys.getsizeof, ghosts.keys()))) / sample_n
+
+        def element_size(onmiss):
+            cache = Cache(sample_n)
+            for i in range(sample_n):
+                cache.get_replace(make_id(i), onmiss)
+            index, values, _ = cache_memory(cache, sample_n)
+            return (index + values) / sample_n + ghost_size
+
+        def person_size(history_n):
+            person = Person(make_id(0), history_n)
+            for i in range(history_n):
+                person.history.appendleft(make_id(i), False)
+            person.prev_recs = set(map(make_id, range(self.recs_limit)))
+            return deep_sizeof(person)
+
+        def trending_size():
+            trending = Trending(max(self.recs_limit * 10, 50))
+            for i in range(trending.top_n):
+                trending.add(make_id(i))
+            return deep_sizeof(trending)
+
+        # gradients show up after the first fit() and are as big as parameters
+        grads, _, _ = rnn_memory(self.rnn)
+        available = memory_budget - rss() - grads - self.documents_n * element_size(None) - trending_size()
+        prs_size = element_size(None)
+
+        history_n = self.history_n
+        persons_n = int(available // (prs_size + person_size(history_n)))
+        if persons_n < self.documents_n and history_n > 10:
+            # person size is linear in history length, let's solve for documents_n persons
+            short, full = person_size(10), person_size(history_n)
+            target = available / self.documents_n - prs_size
+            history_n = int(10 + (target - short) * (history_n - 10) / (full - short))
+            history_n = max(10, min(self.history_n, history_n))
+            persons_n = int(available // (prs_size + person_size(history_n)))
+
+        if persons_n < 1:
+            raise ValueError('Memory budget is too small')
+        return persons_n, history_n
@@ -38,23 +38,26 @@ class RNN(torch.nn.Module):
         return Y
 
     def fit(self, X):
-        loss = 0
-        for i in range(len(X) - 1):
-            x = torch.tensor(X[i], dtype=torch.long, device=self.device).view(1, 1, -1)
-            y = torch.tensor(X[i+1], dtype=torch.long, device=self.device).view(-1)
+        # record_function() labels show up in torch profiler traces
+        # and cost next to nothing when profiler isn't running
+        with torch.profiler.record_function('RNN.fit'):
+            loss = 0
+            for i in range(len(X) - 1):
+                x = torch.tensor(X[i], dtype=torch.long, device=self.device).view(1, 1, -1)
+                y = torch.tensor(X[i+1], dtype=torch.long, device=self.device).view(-1)
 
-            Y = self.forward(x)
-            loss += self.loss(Y, y)
+                Y = self.forward(x)
+                loss += self.loss(Y, y)
 
-        self.zero_grad()
-        loss.backward(retain_graph=True)
-        torch.nn.utils.clip_grad_norm_(self.parameters(), 5)
-        self.optim.step()
+            self.zero_grad()
+            loss.backward(retain_graph=True)
+            torch.nn.utils.clip_grad_norm_(self.parameters(), 5)
+            self.optim.step()
 
-        return loss.item()
+            return loss.item()
 
     def predict(self, x):
-        with torch.no_grad():
+        with torch.profiler.record_function('RNN.predict'), torch.no_grad():
             x = torch.tensor(x, dtype=torch.long, device=self.device).view(1, 1, -1)
             Y = self.forward(x)
             _, prediction = Y.topk(self.num_embeddings)
@@ -0,0 +1,87 @@
+from collections import OrderedDict, deque
+from threading import Thread, Condition
+
+class Scheduler(object):
+    """A training thread shared by many recommenders
+
+        Every recommender gets a queue of its own, see register(),
+        and the thread takes one sequence from every non-empty queue in turn
+        so that a busy recommender can't starve quiet ones.
+        A queue holds up to queue_limit sequences, put() drops a sequence
+        when the queue is full.
+
+        RNN is learnt in this thread while the dispatcher thread
+        keeps on calling predict(), just like Hogwild workers do.
+        Since this runs autograd in the server process, no Hogwild
+        workers may be forked once the thread has started, see src/trainer.py
+    """
+
+    def __init__(self, queue_limit = 1000):
+        self.queue_limit    = queue_limit
+        self.queues         = OrderedDict()
+        self.busy           = None
+        self.cond           = Condition()
+        self.thread         = Thread(target = self._train, daemon = True)
+
+    def register(self, name, recommender):
+        """Returns a queue to be set as recommender.trainer
+        """
+        with self.cond:
+            if not self.thread.is_alive():
+                self.thread.start()
+            queue = SchedulerQueue(self, name, recommender)
+            self.queues[name] = queue
+            return queue
+
+    def unregister(self, name):
+        """Drops the queue, waits for the sequence being learnt if any
+        """
+        with self.cond:
+            self.queues.pop(name, None)
+            while self.busy == name:
+                self.cond.wait()
+
+    def _train(self):
+        while True:
+            with self.cond:
+                while not any(queue.pending for queue in self.queues.values()):
+                    self.cond.wait()
+                # the first non-empty queue goes to the end of the line
+                for name, queue in self.queues.items():
+                    if queue.pending:
+                        break
+                self.queues.move_to_end(name)
+                inputs = queue.pending.popleft()
+                self.busy = name
+
+            try:
+                loss = queue.recommender.rnn.fit(inputs)
+                queue.recommender.send('rnn_loss.avg', loss)
+            except Exception as e:
+                print('Error in training:', e)
+
+            with self.cond:
+                self.busy = None
+                self.cond.notify_all()
+
+
+class SchedulerQueue(object):
+    """A recommender's queue in the Scheduler, quacks like Trainer
+    """
+
+    def __init__(self, scheduler, name, recommender):
+        self.scheduler      = scheduler
+        self.name           = name
+        self.recommender    = recommender
+        self.pending        = deque()
+
+    def put(self, inputs):
+        with self.scheduler.cond:
+            if len(self.pending) >= self.scheduler.queue_limit:
+                return False
+            self.pending.append(inputs)
+            self.scheduler.cond.notify_all()
+            return True
+
+    def stop(self):
+        self.scheduler.unregister(self.name)
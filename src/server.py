@@ -1,7 +1,7 @@
-from threading import Thread
-from queue import Queue
+from threading import Thread, Lock, Event
+from queue import Queue, Full
 
-import os, time, sys, logging, socket, signal
+import os, time, sys, logging, socket, signal, struct
 
 def lazyprop(fn):
     attr_name = '_lazy_' + fn.__name__
@@ -23,10 +23,24 @@ class Server(object):
             port        = 25000,
             logfile     = 'var/log/{}.log'.format(os.path.basename(sys.argv[0])),
             pidfile     = 'var/run/{}.pid'.format(os.path.basename(sys.argv[0])),
-            queue_limit = 10000
+            queue_limit = 10000,
+            admin_dispatcher = None,
+            admin_host  = '127.0.0.1',
+            admin_port  = None,
+            tcp_port    = None,
+            unix_path   = None,
+            startup     = None,
+            shutdown    = None
         ):
         self.dispatcher         = dispatcher
+        self.admin_dispatcher   = admin_dispatcher
+        self.admin_host         = admin_host
+        self.admin_port         = admin_port
+        self.tcp_port           = tcp_port
+        self.unix_path          = unix_path
         self.periodic           = periodic
+        self.startup            = startup
+        self.shutdown           = shutdown
         self.period             = period
         self.host               = host
         self.port               = port
@@ -34,8 +48,11 @@ class Server(object):
         self.pidfile            = pidfile
         self.queue_limit        = queue_limit
         self.running            = False
+        self.stopped            = Event()
         self.chkdir(logfile)
         self.chkdir(pidfile)
+        if unix_path:
+            self.chkdir(unix_path)
 
     @lazyprop
     def daemon(self):
@@ -45,9 +62,21 @@ class Server(object):
     def socket(self):
         return Socket(self.host, self.port, self.dispatch)
 
+    @lazyprop
+    def admin_socket(self):
+        return Socket(self.admin_host, self.admin_port, self.dispatch_admin)
+
+    @lazyprop
+    def tcp_socket(self):
+        return StreamSocket((self.host, self.tcp_port), self.dispatch_stream, socket.AF_INET)
+
+    @lazyprop
+    def unix_socket(self):
+        return StreamSocket(self.unix_path, self.dispatch_stream, socket.AF_UNIX)
+
     @lazyprop
     def queue(self):
-        return Queue()
+        return Queue(self.queue_limit)
 
     @lazyprop
     def dispatcher_thread(self):
@@ -57,10 +86,22 @@ class Server(object):
     def periodic_thread(self):
         return Thread(target = self._periodic)
 
+    @lazyprop
+    def admin_thread(self):
+        return Thread(target = self.admin_socket.serve, daemon = True)
+
+    @lazyprop
+    def tcp_thread(self):
+        return Thread(target = self.tcp_socket.serve, daemon = True)
+
+    @lazyprop
+    def unix_thread(self):
+        return Thread(target = self.unix_socket.serve, daemon = True)
+
 
     def chkdir(self, sfile):
         sdir = os.path.dirname(sfile)
-        if not os.path.isdir(sdir):
+        if sdir and not os.path.isdir(sdir):
             os.makedirs(sdir)
 
     def command(self, cmd):
@@ -71,47 +112,112 @@ class Server(object):
         self.running = True
         print('Started!!1')
 
+        # the daemon process is there, no threads are yet
+        if self.startup:
+            self.startup(self)
+
+        # sockets are bound after startup so that processes it forks don't
+        # inherit them, and before any thread so that the server refuses
+        # to start rather than runs with a part of them
+        try:
+            self.socket.bind()
+            if self.admin_dispatcher and self.admin_port:
+                self.admin_socket.bind()
+            if self.tcp_port:
+                self.tcp_socket.bind()
+            if self.unix_path:
+                self.unix_socket.bind()
+        except Exception:
+            self.running = False
+            # a Unix socket file is removed by the one who has bound it
+            if self.tcp_port:
+                self.tcp_socket.close()
+            if self.unix_path:
+                self.unix_socket.close()
+            if self.shutdown:
+                self.shutdown(self)
+            raise
+
         self.dispatcher_thread.start()
         if self.periodic:
             self.periodic_thread.start()
+        if self.admin_dispatcher and self.admin_port:
+            self.admin_thread.start()
+        if self.tcp_port:
+            self.tcp_thread.start()
+        if self.unix_path:
+            self.unix_thread.start()
 
-        self.socket.listen()
+        self.socket.serve()
 
     def onstop(self):
         self.running = False
-        self.queue.put(('__stop__', None))
-        self.queue.join()
-        self.dispatcher_thread.join()
+        self.stopped.set()
 
+        # periodic may queue requests, so it's stopped first
         if self.periodic:
             self.periodic_thread.join()
 
+        # dispatch*() drop requests from now on, still open connections
+        # are closed as well so that clients see the server has gone
+        if self.tcp_port:
+            self.tcp_socket.close()
+        if self.unix_path:
+            self.unix_socket.close()
+
+        # the dispatcher is done with everything queued before the sentinel
+        # once it exits, whatever a socket thread has managed to queue after
+        # it is left there
+        self.queue.put(('__stop__', None, None))
+        self.dispatcher_thread.join()
+
+        if self.shutdown:
+            self.shutdown(self)
+
         print('Stopped =(')
 
     def dispatch(self, data, response):
-        if self.queue.qsize() >= self.queue_limit:
+        if not self.running:
+            return
+        try:
+            self.queue.put_nowait((data, response, self.dispatcher))
+        except Full:
             print('The queue is full')
-        else:
-            self.queue.put((data, response))
+
+    def dispatch_stream(self, data, response):
+        # Unlike datagrams, stream requests wait for room in the queue
+        # which makes clients wait too, thanks to TCP flow control
+        if not self.running:
+            return
+        self.queue.put((data, response, self.dispatcher))
+
+    def dispatch_admin(self, data, response):
+        # Admin requests share the queue with regular ones so that
+        # admin_dispatcher is run by the dispatcher thread too
+        if not self.running:
+            return
+        self.queue.put((data, response, self.admin_dispatcher))
 
     def _dispatcher(self):
         while True:
-            data, response = self.queue.get()
+            data, response, dispatcher = self.queue.get()
             
             if data == '__stop__':
                 self.queue.task_done()
                 break
 
             try:
-                self.dispatcher(self, data, response)
+                dispatcher(self, data, response)
             except Exception as e:
                 print('Error in dispatcher:', e)
 
             self.queue.task_done()
 
     def _periodic(self):
-        while self.running:
-            time.sleep(self.period)
+        # waiting on the event rather than sleeping lets onstop() go right away
+        while not self.stopped.wait(self.period):
+            if not self.running:
+                break
             self.periodic(self)
 
     def _init_logger(self):
@@ -209,8 +315,14 @@ class Socket(object):
         self.dispatch = dispatch
 
     def listen(self):
+        self.bind()
+        self.serve()
+
+    def bind(self):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind((self.host, self.port))
+
+    def serve(self):
         while True:
             data, address = self.sock.recvfrom(self.max_size)
             response = lambda rdata: self.sock.sendto(rdata, address)
@@ -220,6 +332,126 @@ class Socket(object):
                 print('Error in dispatch:', e)
 
 
+class StreamSocket(object):
+    """Length-framed pipelined transport over TCP or Unix domain socket
+
+        Every frame, either a request or a response, is a header followed by data:
+            length (uint32, big-endian): number of bytes of data
+            request_id (uint32, big-endian): arbitrary, chosen by a client
+        A response comes in a frame with the same request_id as the request,
+        so a client can keep a connection open and have many requests in flight.
+        Requests that get no response over UDP (i.e. RECR) get none here either.
+    """
+
+    HEADER = struct.Struct('!II')
+
+    def __init__(self, address, dispatch, family = socket.AF_INET, max_size = 65535):
+        self.address = address
+        self.family = family
+        self.max_size = max_size
+        self.dispatch = dispatch
+        self.sock = None
+        self.conns = set()
+        self.conns_lock = Lock()
+
+    def listen(self):
+        self.bind()
+        self.serve()
+
+    def bind(self):
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            # a socket file is only removed when nobody listens on it anymore
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.address)
+                raise Exception('Socket is in use: {}'.format(self.address))
+            except ConnectionRefusedError:
+                os.remove(self.address)
+            finally:
+                probe.close()
+
+        self.sock = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family != socket.AF_UNIX:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.address)
+        self.sock.listen(socket.SOMAXCONN)
+
+    def serve(self):
+        sock = self.sock
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                # close() has been called
+                break
+            if self.family != socket.AF_UNIX:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.conns_lock:
+                self.conns.add(conn)
+            Thread(target = self._serve, args = (conn,), daemon = True).start()
+
+    def close(self):
+        if self.sock is None:
+            return
+        try:
+            # wakes accept() up
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.sock = None
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.remove(self.address)
+
+        # wakes connection threads up, they close connections themselves
+        with self.conns_lock:
+            conns = list(self.conns)
+        for conn in conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _serve(self, conn):
+        # responses are written by the dispatcher thread, possibly
+        # at the same time as error responses by this one
+        lock = Lock()
+        def responder(request_id):
+            def response(rdata):
+                try:
+                    with lock:
+                        conn.sendall(self.HEADER.pack(len(rdata), request_id) + rdata)
+                except OSError:
+                    # the client has gone, nobody to respond to
+                    pass
+            return response
+
+        reader = conn.makefile('rb')
+        try:
+            while True:
+                header = reader.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    break
+                length, request_id = self.HEADER.unpack(header)
+                if length > self.max_size:
+                    print('Frame is too long:', length)
+                    break
+                data = reader.read(length)
+                if len(data) < length:
+                    break
+                try:
+                    self.dispatch(data, responder(request_id))
+                except Exception as e:
+                    print('Error in dispatch:', e)
+        except OSError:
+            pass
+        finally:
+            with self.conns_lock:
+                self.conns.discard(conn)
+            reader.close()
+            conn.close()
+
+
 class StreamToLogger(object):
    def __init__(self, logger, log_level=logging.INFO):
       self.logger = logger
@@ -0,0 +1,105 @@
+from array import array
+from heapq import heappush, heappop, heapify
+
+import hashlib, time
+
+class Trending(object):
+    """Constant memory tracker of currently popular documents
+
+        Visits are counted by a count-min sketch
+            see https://en.wikipedia.org/wiki/Count%E2%80%93min_sketch
+        and the top_n documents with highest estimated counts are kept aside.
+        Counts decay exponentially with the given half_life (seconds): instead of
+        decaying every counter all the time, newer visits weigh more, i.e. a visit
+        made half_life seconds later counts twice as much (forward decay).
+        Every add() costs depth counter updates and, at most, a couple of operations
+        on a heap of top_n documents, so the cost doesn't depend on the traffic.
+
+        Constructor arguments:
+            top_n (int): how many trending documents are kept
+            half_life (float): seconds it takes for a visit to lose half of its weight
+            width (int): counters per row of the sketch
+            depth (int): rows of the sketch, i.e. hash functions
+            clock (function): returns current time in seconds
+    """
+
+    # weights are rescaled before they get anywhere close to float overflow
+    MAX_WEIGHT = 2.0 ** 64
+
+    def __init__(self, top_n = 50, half_life = 3600, width = 2048, depth = 4, clock = time.time):
+        self.top_n      = top_n
+        self.half_life  = half_life
+        self.width      = width
+        self.depth      = depth
+        self.clock      = clock
+        self.epoch      = clock()
+        self.rows       = [array('d', [0.0]) * width for _ in range(depth)]
+        # document_id -> estimated (weighted) count
+        self.top        = {}
+        # (count, document_id) min-heap of the top entries, counts only grow
+        # between rescales, so an entry goes stale once its document gets
+        # another count or leaves the top, stale entries are dropped lazily
+        self.heap       = []
+
+    def add(self, document_id):
+        weight = 2.0 ** ((self.clock() - self.epoch) / self.half_life)
+        if weight > self.MAX_WEIGHT:
+            self._rescale()
+            weight = 2.0 ** ((self.clock() - self.epoch) / self.half_life)
+
+        estimate = None
+        for row, col in zip(self.rows, self._cols(document_id)):
+            row[col] += weight
+            if estimate is None or row[col] < estimate:
+                estimate = row[col]
+
+        if document_id in self.top or len(self.top) < self.top_n:
+            self.top[document_id] = estimate
+            heappush(self.heap, (estimate, document_id))
+        else:
+            lowest = self._lowest()
+            if self.top[lowest] < estimate:
+                heappop(self.heap)
+                del self.top[lowest]
+                self.top[document_id] = estimate
+                heappush(self.heap, (estimate, document_id))
+
+        if len(self.heap) > 2 * self.top_n:
+            # amortized over at least top_n add()-s
+            self._compact()
+
+    def trending(self):
+        """Returns a list of document_id-s, the most popular first
+        """
+        return sorted(self.top, key = self.top.get, reverse = True)
+
+    def _lowest(self):
+        # the least counted document in the top, stale entries go on the way
+        while True:
+            count, document_id = self.heap[0]
+            if self.top.get(document_id) == count:
+                return document_id
+            heappop(self.heap)
+
+    def _compact(self):
+        self.heap = [(count, document_id) for document_id, count in self.top.items()]
+        heapify(self.heap)
+
+    def _cols(self, document_id):
+        # Kirsch-Mitzenmacher: depth hash functions out of a single hash
+        # str hash() is salted per process, which would break pickled sketches
+        h = int.from_bytes(hashlib.blake2b(document_id.encode(), digest_size = 8).digest(), 'little')
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def _rescale(self):
+        # moves the epoch to now, which divides every count by the same factor
+        now = self.clock()
+        factor = 2.0 ** (-(now - self.epoch) / self.half_life)
+        self.epoch = now
+        for row in self.rows:
+            for i in range(self.width):
+                row[i] *= factor
+        for document_id in self.top:
+            self.top[document_id] *= factor
+        self._compact()
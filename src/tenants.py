@@ -0,0 +1,89 @@
+from collections import OrderedDict
+
+from .scheduler import Scheduler
+
+import os, re, pickle
+
+class Tenants(object):
+    """Hosts many recommenders in a single process
+
+        A recommender is created the first time its tenant is asked for.
+        No more than resident_n recommenders are kept in memory, the least
+        recently used one is pickled into swap_dir when there's one too many
+        and is loaded back (and the file is removed) the next time it's needed.
+
+        Tenants share the dispatcher thread for record()/recommend() and
+        the Scheduler thread for learning RNN, see src/scheduler.py
+        Hogwild workers (train_workers) aren't supported for tenants: they'd be
+        forked on every swap in, after the Scheduler has run autograd, which
+        torch doesn't support.
+
+        NOTE that tenants are swapped by the dispatcher thread and only when there
+        are more than resident_n of them in use, not when they go idle. Pickling
+        a recommender (RNN, Adagrad state, persons) takes a while and holds every
+        tenant up, so resident_n has to be at least the number of tenants that are
+        active at the same time, otherwise requests keep swapping them in and out.
+        The files are as big as the recommenders, see MEM admin request.
+
+        Constructor arguments:
+            factory (function): takes a tenant name and returns a new Recommender,
+                it's expected to raise KeyError for an unknown tenant and to refuse
+                train_workers before building anything, get() only double checks
+            resident_n (int): maximum number of recommenders kept in memory
+            swap_dir (str): where swapped out recommenders are kept
+            queue_limit (int): maximum number of sequences waiting
+                for the training thread per tenant
+    """
+
+    NAME_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+    def __init__(self, factory, resident_n = 10, swap_dir = 'var/tenants', queue_limit = 1000):
+        self.factory        = factory
+        self.resident_n     = resident_n
+        self.swap_dir       = swap_dir
+        self.resident       = OrderedDict()
+        self.scheduler      = Scheduler(queue_limit)
+
+    def get(self, name):
+        """Returns a recommender of a tenant, either resident,
+            loaded from swap_dir or brand new
+        """
+        if name in self.resident:
+            self.resident.move_to_end(name)
+            return self.resident[name]
+
+        # names make it into file paths, let's be strict about them
+        if not self.NAME_RE.match(name):
+            raise KeyError('Bad tenant name: {}'.format(name))
+
+        recommender = self._swap_in(name)
+        if recommender is None:
+            recommender = self.factory(name)
+        if recommender.train_workers > 0:
+            raise ValueError('train_workers is not supported for tenants')
+        recommender.trainer = self.scheduler.register(name, recommender)
+
+        self.resident[name] = recommender
+        while len(self.resident) > self.resident_n:
+            self._swap_out(*self.resident.popitem(last = False))
+        return recommender
+
+    def _path(self, name):
+        return os.path.join(self.swap_dir, name + '.pickle')
+
+    def _swap_in(self, name):
+        path = self._path(name)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as fh:
+            recommender = pickle.load(fh)
+        os.remove(path)
+        return recommender
+
+    def _swap_out(self, name, recommender):
+        if recommender.trainer is not None:
+            recommender.trainer.stop()
+        if not os.path.isdir(self.swap_dir):
+            os.makedirs(self.swap_dir)
+        with open(self._path(name), 'wb') as fh:
+            pickle.dump(recommender, fh)
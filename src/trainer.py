@@ -0,0 +1,137 @@
+from queue import Full
+
+import torch
+import torch.multiprocessing as mp
+
+from .graphite import Graphite
+
+class Trainer(object):
+    """Hogwild-style parallel training of RNN
+
+        Parameters of the model are moved to shared memory and workers_n
+        processes apply their updates to them with no locking at all
+        see https://arxiv.org/abs/1106.5730
+        NOTE that updates of this model aren't sparse: the gradient of the output
+        Linear layer is dense through the softmax, so are the ones of GRU weights,
+        and Adagrad writes every element of every parameter on every step,
+        the embedding matrix included. Workers do race on the whole model,
+        a worker's step may overwrite or mix with another's. That's the price
+        of no locking, the model is still learning, just noisier.
+        Every worker keeps Adagrad sums of its own, which see about 1/workers_n
+        of the updates, therefore the effective learning rate is higher than
+        with a single process and grows with workers_n.
+
+        Constructor arguments:
+            rnn (RNN): the model, the very same object keeps on serving predict()
+                in the calling process and sees updates as they are made
+            workers_n (int): number of training processes
+            queue_limit (int): maximum number of sequences waiting for a worker,
+                put() drops a sequence when the queue is full so that training
+                never holds record() up
+            metrics_prefix (str): prefix of the metrics workers send to graphite
+
+        Workers are started by start() rather than by the constructor so that
+        they're forked by the daemon rather than by the process that has created
+        the object, see startup() in main.py. start() has to be called before this
+        process runs autograd even once, torch doesn't support autograd in a child
+        forked after that (see "Autograd and Fork" in torch notes).
+        'fork' is used on purpose: 'spawn' would import the main script in every
+        worker once again. CUDA doesn't survive a fork either, hence the trainer
+        works with RNN on 'cpu' device only.
+    """
+
+    def __init__(self, rnn, workers_n, queue_limit = 10000, metrics_prefix = 'recomlive'):
+        if rnn.device.type != 'cpu':
+            raise ValueError('Parallel training requires cpu device')
+        self.rnn            = rnn
+        self.workers_n      = workers_n
+        self.queue_limit    = queue_limit
+        self.metrics_prefix = metrics_prefix
+        self.queue          = None
+        self.workers        = []
+        self.alive          = 0
+        self.dead           = set()
+
+    def start(self):
+        self.rnn.share_memory()
+        ctx = mp.get_context('fork')
+        self.queue = ctx.Queue(self.queue_limit)
+        for i in range(self.workers_n):
+            worker = ctx.Process(target = train, args = (i, self.rnn, self.queue, self.metrics_prefix), daemon = True)
+            worker.start()
+            self.workers.append(worker)
+        self.alive = self.workers_n
+
+    def put(self, inputs):
+        """Hands a sequence of document indexes over to workers
+
+            Returns False if the sequence has been dropped, sequences are dropped
+            until start() is called, learning in this process instead would
+            make it unsafe to fork the workers later on
+        """
+        if self.queue is None or self.alive == 0:
+            # nobody would ever take it from the queue
+            return False
+        try:
+            self.queue.put_nowait(inputs)
+            return True
+        except Full:
+            return False
+
+    def check(self):
+        """Reports workers that have died, returns the number of alive ones
+        """
+        self.alive = 0
+        for i, worker in enumerate(self.workers):
+            if worker.is_alive():
+                self.alive += 1
+            elif i not in self.dead:
+                self.dead.add(i)
+                print('Training worker {} has died, exit code {}'.format(i, worker.exitcode))
+        Graphite().send('{}.rnn_workers_alive.avg'.format(self.metrics_prefix), self.alive)
+        return self.alive
+
+    def stop(self, timeout = 5):
+        if self.queue is None:
+            return
+        for _ in self.workers:
+            try:
+                self.queue.put(None, timeout = timeout)
+            except Full:
+                # dead workers don't empty the queue
+                break
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self.queue = None
+        self.workers = []
+        self.alive = 0
+
+
+def train(i, rnn, queue, metrics_prefix):
+    """Worker process main loop
+    """
+    # Workers are the ones who keep cores busy,
+    # intra-op parallelism would only oversubscribe them
+    torch.set_num_threads(1)
+    graphite = Graphite()
+
+    # rnn.optim is inherited from the parent, so is the state of Adagrad
+    # which from now on is private to the worker, only parameters are shared
+    while True:
+        inputs = queue.get()
+        if inputs is None:
+            break
+
+        try:
+            loss = rnn.fit(inputs)
+        except Exception as e:
+            print('Error in training worker {}:'.format(i), e)
+            graphite.send('{}.rnn_worker_{}.error.sum'.format(metrics_prefix, i), 1)
+            continue
+
+        graphite.send('{}.rnn_loss.avg'.format(metrics_prefix), loss)
+        graphite.send('{}.rnn_worker_{}.learn.sum'.format(metrics_prefix, i), 1)
+        graphite.send('{}.rnn_worker_{}.loss.avg'.format(metrics_prefix, i), loss)
+
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""Microbenchmarks of ARC cache and Person history
+
+For every workload in tests/workloads.py reports throughput (ops/sec) of
+Cache.get_replace(), get_by_key(), get_by_idx() and of the Person history
+updates that Recommender.record() does, as well as memory allocated while
+doing so: peak and retained KiB as traced by tracemalloc.
+
+Usage:
+    python tests/bench_cache.py [--size 2000] [--n 200000] [--impl src.cache:Cache ...]
+
+Pass --impl more than once to compare implementations of Cache,
+check them with tests/test_cache.py first.
+"""
+
+import argparse, importlib, os, random, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.person import Person
+from workloads import WORKLOADS
+
+
+def bench_get_replace(impl, size, keys):
+    def setup():
+        return impl(size)
+    def run(cache):
+        for key in keys:
+            cache.get_replace(key, None)
+    return setup, run
+
+def bench_get_by_key(impl, size, keys):
+    def setup():
+        cache = impl(size)
+        for key in keys[:4 * size]:
+            cache.get_replace(key, None)
+        return cache
+    def run(cache):
+        for key in keys:
+            cache.get_by_key(key)
+    return setup, run
+
+def bench_get_by_idx(impl, size, keys):
+    rnd = random.Random(0)
+    idxs = [rnd.randrange(size) for _ in keys]
+    def setup():
+        cache = impl(size)
+        for key in keys[:4 * size]:
+            cache.get_replace(key, None)
+        return cache
+    def run(cache):
+        for idx in idxs:
+            cache.get_by_idx(idx)
+    return setup, run
+
+def bench_person(impl, size, keys):
+    # the same history length as Recommender has by default
+    history_n = max(size // 10, 10)
+    def setup():
+        return Person('p', history_n)
+    def run(person):
+        for key in keys:
+            person.append_history(key)
+            unlearned = person.unlearned_docs()
+            if len(unlearned) >= 2:
+                person.mark_learned(unlearned)
+    return setup, run
+
+BENCHMARKS = [
+    ('get_replace', bench_get_replace),
+    ('get_by_key', bench_get_by_key),
+    ('get_by_idx', bench_get_by_idx),
+    ('person', bench_person),
+]
+
+
+def measure(setup, run, ops):
+    """Returns a tuple of (ops/sec, peak KiB, retained KiB)
+        time and memory are measured in separate runs
+        since tracing allocations slows everything down
+    """
+    state = setup()
+    started = time.perf_counter()
+    run(state)
+    ops_per_sec = ops / (time.perf_counter() - started)
+
+    state = setup()
+    tracemalloc.start()
+    run(state)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return ops_per_sec, peak / 1024, retained / 1024
+
+def load_impl(path):
+    module, name = path.split(':')
+    return getattr(importlib.import_module(module), name)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--size', type = int, default = 2000, help = 'cache size')
+    parser.add_argument('--keys', type = int, default = None, help = 'distinct keys, 5 x size by default')
+    parser.add_argument('--n', type = int, default = 200000, help = 'operations per benchmark')
+    parser.add_argument('--impl', action = 'append', default = None, help = 'module:Class of a cache')
+    parser.add_argument('--workload', action = 'append', default = None, choices = sorted(WORKLOADS))
+    args = parser.parse_args()
+
+    impls = [(path, load_impl(path)) for path in args.impl or ['src.cache:Cache']]
+    n_keys = args.keys or 5 * args.size
+
+    print('{:<8} {:<12} {:<24} {:>12} {:>10} {:>12}'.format(
+        'workload', 'op', 'impl', 'ops/sec', 'peak KiB', 'retained KiB'))
+    for workload in args.workload or sorted(WORKLOADS):
+        keys = WORKLOADS[workload](n_keys, args.n)
+        for op, bench in BENCHMARKS:
+            for i, (path, impl) in enumerate(impls):
+                if op == 'person' and i > 0:
+                    # Person doesn't depend on the cache implementation
+                    continue
+                ops_per_sec, peak, retained = measure(*bench(impl, args.size, keys), len(keys))
+                print('{:<8} {:<12} {:<24} {:>12.0f} {:>10.1f} {:>12.1f}'.format(
+                    workload, op, path if op != 'person' else '-', ops_per_sec, peak, retained))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+import os, sys
+
+# src/ isn't an installed package, tests import it from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,69 @@
+from collections import OrderedDict
+
+class ReferenceARC(object):
+    """ARC as it is written down in the paper, with no regard for speed
+        see Megiddo & Modha, ARC: A Self-Tuning, Low Overhead Replacement Cache, FAST 2003
+
+        Every list is an OrderedDict of keys, the least recently used key goes first
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.p = 0
+        self.t1, self.t2 = OrderedDict(), OrderedDict()
+        self.b1, self.b2 = OrderedDict(), OrderedDict()
+
+    def resident(self):
+        return set(self.t1) | set(self.t2)
+
+    def access(self, x):
+        """Returns True on a cache hit
+        """
+        c = self.size
+
+        # Case I: x is in T1 or T2
+        if x in self.t1 or x in self.t2:
+            self.t1.pop(x, None)
+            self.t2.pop(x, None)
+            self.t2[x] = None
+            return True
+
+        # Case II: x is in B1
+        if x in self.b1:
+            self.p = min(c, self.p + max(len(self.b2) / len(self.b1), 1))
+            self.replace(x)
+            del self.b1[x]
+            self.t2[x] = None
+            return False
+
+        # Case III: x is in B2
+        if x in self.b2:
+            self.p = max(0, self.p - max(len(self.b1) / len(self.b2), 1))
+            self.replace(x)
+            del self.b2[x]
+            self.t2[x] = None
+            return False
+
+        # Case IV: x is nowhere
+        if len(self.t1) + len(self.b1) == c:
+            if len(self.t1) < c:
+                self.b1.popitem(last = False)
+                self.replace(x)
+            else:
+                self.t1.popitem(last = False)
+        else:
+            total = len(self.t1) + len(self.t2) + len(self.b1) + len(self.b2)
+            if total >= c:
+                if total == 2 * c:
+                    self.b2.popitem(last = False)
+                self.replace(x)
+        self.t1[x] = None
+        return False
+
+    def replace(self, x):
+        if self.t1 and (len(self.t1) > self.p or (x in self.b2 and len(self.t1) == self.p)):
+            key, _ = self.t1.popitem(last = False)
+            self.b1[key] = None
+        else:
+            key, _ = self.t2.popitem(last = False)
+            self.b2[key] = None
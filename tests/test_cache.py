@@ -0,0 +1,113 @@
+import random
+
+import pytest
+
+from src.cache import Cache, Deque, IDX, KEY
+from reference import ReferenceARC
+from workloads import WORKLOADS
+
+# Faster implementations of Cache are supposed to be added here
+# so that they are checked against the reference as well
+IMPLEMENTATIONS = [Cache]
+
+
+def assert_same_state(cache, ref):
+    assert list(cache.t1.od) == list(ref.t1)
+    assert list(cache.t2.od) == list(ref.t2)
+    assert list(cache.b1.od) == list(ref.b1)
+    assert list(cache.b2.od) == list(ref.b2)
+    assert cache.t1_size == ref.p
+
+def assert_consistent(cache):
+    # every slot is either cached or in the pool, never both
+    assert set(cache.key_map) == set(cache.t1) | set(cache.t2)
+    assert len(cache.key_map) + len(cache.idx_pool) == cache.size
+    idxs = [val[IDX] for val in cache.key_map.values()] + [val[IDX] for val in cache.idx_pool]
+    assert sorted(idxs) == list(range(cache.size))
+    for key, val in cache.key_map.items():
+        assert val[KEY] == key
+        assert cache.get_by_idx(val[IDX]).key == key
+    for val in cache.idx_pool:
+        assert cache.get_by_idx(val[IDX]) is None
+
+def run_differential(impl, size, keys, check_every = 1):
+    cache, ref = impl(size), ReferenceARC(size)
+    for i, key in enumerate(keys):
+        res = cache.get_replace(key, key.upper())
+        assert res.is_hit == ref.access(key), 'step {} key {}'.format(i, key)
+        assert res.key == key
+        assert res.value == key.upper()
+        if i % check_every == 0:
+            assert_same_state(cache, ref)
+            assert_consistent(cache)
+    assert_same_state(cache, ref)
+    assert_consistent(cache)
+
+
+@pytest.mark.parametrize('impl', IMPLEMENTATIONS)
+@pytest.mark.parametrize('seed', range(50))
+def test_random_against_reference(impl, seed):
+    # small caches and key spaces hit the corner cases most often
+    rnd = random.Random(seed)
+    size = rnd.randint(1, 8)
+    n_keys = rnd.randint(1, 4 * size)
+    keys = ['k{}'.format(rnd.randrange(n_keys)) for _ in range(500)]
+    run_differential(impl, size, keys)
+
+
+@pytest.mark.parametrize('impl', IMPLEMENTATIONS)
+@pytest.mark.parametrize('workload', sorted(WORKLOADS))
+@pytest.mark.parametrize('size', [1, 10, 100])
+def test_workload_against_reference(impl, workload, size):
+    keys = WORKLOADS[workload](5 * size, 3000, seed = size)
+    run_differential(impl, size, keys, check_every = 97)
+
+
+def test_get_by_key():
+    cache = Cache(2)
+    assert cache.get_by_key('a') is None
+    cache.get_replace('a', 1)
+    res = cache.get_by_key('a')
+    assert (res.is_hit, res.key, res.value) == (True, 'a', 1)
+
+
+def test_get_by_idx():
+    cache = Cache(2)
+    assert cache.get_by_idx(0) is None
+    assert cache.get_by_idx(-1) is None
+    assert cache.get_by_idx(2) is None
+    assert cache.get_by_idx('0') is None
+    res = cache.get_replace('a', 1)
+    assert cache.get_by_idx(res.idx).key == 'a'
+
+
+def test_get_replace_onmiss():
+    cache = Cache(2)
+    calls = []
+    onmiss = lambda: calls.append(1) or 'value'
+    assert cache.get_replace('a', onmiss).value == 'value'
+    assert cache.get_replace('a', onmiss).is_hit
+    assert len(calls) == 1
+
+
+def test_idx_recycling():
+    cache = Cache(2)
+    idxs = {cache.get_replace(key).idx for key in 'abcdefg'}
+    assert idxs <= {0, 1}
+    # an evicted key can't be resolved by its former idx anymore
+    assert cache.get_by_key('a') is None
+    assert {cache.get_by_idx(i).key for i in range(2)} == {'f', 'g'}
+
+
+def test_deque():
+    d = Deque()
+    for k in 'abc':
+        d.appendleft(k)
+    d.appendleft('a', True)
+    # iteration goes from the most recent key, keys() from the oldest one
+    assert list(d) == ['a', 'c', 'b']
+    assert d.keys() == ['b', 'c', 'a']
+    assert d[-1] == ('a', True)
+    assert d.pop() == 'b'
+    d.remove('c')
+    assert len(d) == 1 and 'a' in d and 'c' not in d
@@ -0,0 +1,87 @@
+import sys
+
+import pytest
+
+from src.cache import Cache
+from src.memory import deep_sizeof, cache_memory, deque_sizeof, rss, parse_size
+from src.person import Person
+
+
+def test_parse_size():
+    assert parse_size(1024) == 1024
+    assert parse_size('100') == 100
+    assert parse_size('4k') == 4 << 10
+    assert parse_size(' 512M ') == 512 << 20
+    assert parse_size('1.5G') == 3 << 29
+    with pytest.raises(ValueError):
+        parse_size('lots')
+
+
+def test_deep_sizeof():
+    assert deep_sizeof(None) == 0
+    assert deep_sizeof(True) == 0
+    assert deep_sizeof('abc') == sys.getsizeof('abc')
+
+    items = ['a' * 100, 'b' * 100]
+    assert deep_sizeof(items) == sys.getsizeof(items) + sum(map(sys.getsizeof, items))
+    # shared objects are counted once
+    assert deep_sizeof([items, items]) == sys.getsizeof([items, items]) + deep_sizeof(items)
+
+    d = {'key': items}
+    assert deep_sizeof(d) == sys.getsizeof(d) + sys.getsizeof('key') + deep_sizeof(items)
+
+    person = Person('p', 10)
+    assert deep_sizeof(person) > sys.getsizeof(person) + sys.getsizeof(person.__dict__)
+
+
+def fill(cache, n, start = 0, history_n = 10):
+    for i in range(start, start + n):
+        person = Person('p{:015d}'.format(i), history_n)
+        for j in range(history_n):
+            person.append_history('d{:015d}'.format(j))
+        cache.get_replace(person.id, person)
+
+
+def exact_values(cache):
+    return sum(deep_sizeof(el[2]) for el in cache.key_map.values())
+
+
+def test_cache_memory_sparse():
+    # cold start: a few persons in a huge cache still have a size
+    cache = Cache(100000)
+    fill(cache, 50)
+    index, values, ghosts = cache_memory(cache)
+    assert values == exact_values(cache)
+    assert index > 100000 * sys.getsizeof(cache.idx_map[0])
+    assert ghosts == deque_sizeof(cache.b1) + deque_sizeof(cache.b2)
+
+
+def test_cache_memory_estimates():
+    cache = Cache(1000)
+    fill(cache, 1000)
+    # hits move persons to t2, so that newcomers evict the rest into b1
+    fill(cache, 500)
+    fill(cache, 1500, start = 1000)
+    assert len(cache.b1) + len(cache.b2) > 0
+    index, values, ghosts = cache_memory(cache, sample_n = 100)
+
+    # every person is the same size, so is every key
+    assert values == exact_values(cache)
+    key_size = sys.getsizeof('p{:015d}'.format(0))
+    exact_index = sys.getsizeof(cache.key_map) + sys.getsizeof(cache.idx_map) + sys.getsizeof(cache.idx_pool)
+    exact_index += sum(map(sys.getsizeof, cache.idx_map)) + len(cache.key_map) * key_size
+    exact_index += deque_sizeof(cache.t1) + deque_sizeof(cache.t2)
+    assert index == exact_index
+    assert ghosts == deque_sizeof(cache.b1) + deque_sizeof(cache.b2) + (len(cache.b1) + len(cache.b2)) * key_size
+
+
+def test_cache_memory_empty():
+    cache = Cache(10)
+    index, values, ghosts = cache_memory(cache)
+    assert index > 0
+    assert values == 0
+    assert ghosts == deque_sizeof(cache.b1) + deque_sizeof(cache.b2)
+
+
+def test_rss():
+    assert rss() > 0
@@ -0,0 +1,32 @@
+from src.person import Person
+
+
+def test_append_history():
+    person = Person('p', 3)
+    for doc_id in ['a', 'b', 'b', 'c', 'd']:
+        person.append_history(doc_id)
+    # consecutive visits of the same document count once
+    # and the oldest document goes when the history is full
+    assert person.history.keys() == ['b', 'c', 'd']
+
+
+def test_revisit_moves_document_up():
+    person = Person('p', 10)
+    for doc_id in ['a', 'b', 'a']:
+        person.append_history(doc_id)
+    assert person.history.keys() == ['b', 'a']
+
+
+def test_unlearned_docs():
+    person = Person('p', 10)
+    person.append_history('a')
+    person.append_history('b')
+    unlearned = person.unlearned_docs()
+    assert unlearned == ['b', 'a']
+
+    person.mark_learned(unlearned)
+    # the latest document hasn't been an input yet
+    assert person.unlearned_docs() == ['b']
+
+    person.append_history('c')
+    assert person.unlearned_docs() == ['c', 'b']
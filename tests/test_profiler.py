@@ -0,0 +1,79 @@
+import os, pstats, time
+
+import pytest
+
+from src.profiler import Profiler
+
+
+def busy(seconds):
+    deadline = time.time() + seconds
+    n = 0
+    while time.time() < deadline:
+        n += sum(range(100))
+    return n
+
+
+def test_cprofile(tmp_path):
+    profiler = Profiler(outdir = str(tmp_path / 'prof'))
+    profiler.start('cprofile', 60)
+    busy(0.05)
+    path = profiler.stop('cprofile')
+    assert os.path.dirname(path) == str(tmp_path / 'prof')
+    assert path.endswith('.prof')
+    stats = pstats.Stats(path)
+    assert any(func[2] == 'busy' for func in stats.stats)
+    assert profiler.active == {}
+
+
+def test_sample(tmp_path):
+    profiler = Profiler(outdir = str(tmp_path), sample_interval = 0.001)
+    profiler.start('sample', 60)
+    busy(0.2)
+    path = profiler.stop('sample')
+    assert path.endswith('.folded')
+    with open(path) as fh:
+        lines = fh.read().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        assert int(count) > 0
+    assert any('busy (test_profiler.py' in line for line in lines)
+
+
+def test_tracemalloc(tmp_path):
+    profiler = Profiler(outdir = str(tmp_path), tracemalloc_top = 5)
+    profiler.start('tracemalloc', 60)
+    garbage = [bytearray(1024) for _ in range(1000)]
+    path = profiler.stop('tracemalloc')
+    assert path.endswith('.txt')
+    with open(path) as fh:
+        lines = fh.read().splitlines()
+    assert 0 < len(lines) <= 5
+    assert 'test_profiler.py' in lines[0]
+    del garbage
+
+
+def test_expire(tmp_path):
+    profiler = Profiler(outdir = str(tmp_path))
+    profiler.start('cprofile', 0)
+    profiler.start('tracemalloc', 60)
+    paths = profiler.expire()
+    assert len(paths) == 1 and paths[0].endswith('.prof')
+    assert os.path.isfile(paths[0])
+    assert list(profiler.active) == ['tracemalloc']
+    assert profiler.expire() == []
+    profiler.stop('tracemalloc')
+
+
+def test_errors(tmp_path):
+    profiler = Profiler(outdir = str(tmp_path))
+    with pytest.raises(ValueError):
+        profiler.start('unknown', 1)
+    assert profiler.active == {}
+    with pytest.raises(Exception):
+        profiler.stop('cprofile')
+
+    profiler.start('cprofile', 60)
+    with pytest.raises(Exception):
+        profiler.start('cprofile', 60)
+    profiler.stop('cprofile')
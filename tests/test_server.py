@@ -0,0 +1,239 @@
+import os, socket, struct, time
+from queue import Queue
+from threading import Thread
+
+import pytest
+
+from src.server import Server, StreamSocket
+
+HEADER = struct.Struct('!II')
+
+
+class Echo(object):
+    """Responds to everything but RECR with the request itself,
+        from a thread of its own, like the dispatcher thread does
+    """
+
+    def __init__(self):
+        self.queue = Queue()
+        self.responses = []
+        Thread(target = self._respond, daemon = True).start()
+
+    def dispatch(self, data, response):
+        self.responses.append(response)
+        self.queue.put((data, response))
+
+    def _respond(self):
+        while True:
+            data, response = self.queue.get()
+            if not data.startswith(b'RECR'):
+                response(b'OK,' + data)
+
+
+def start(family, address, max_size = 65535):
+    echo = Echo()
+    stream = StreamSocket(address, echo.dispatch, family, max_size)
+    stream.bind()
+    Thread(target = stream.serve, daemon = True).start()
+    return stream, echo
+
+def connect(stream):
+    client = socket.socket(stream.family, socket.SOCK_STREAM)
+    client.settimeout(5)
+    client.connect(stream.sock.getsockname())
+    return client
+
+def frame(request_id, data):
+    return HEADER.pack(len(data), request_id) + data
+
+def read_frame(reader):
+    length, request_id = HEADER.unpack(reader.read(HEADER.size))
+    return request_id, reader.read(length)
+
+
+@pytest.fixture(params = ['tcp', 'unix'])
+def stream(request, tmp_path):
+    if request.param == 'tcp':
+        stream, echo = start(socket.AF_INET, ('127.0.0.1', 0))
+    else:
+        stream, echo = start(socket.AF_UNIX, str(tmp_path / 'r.sock'))
+    stream.echo = echo
+    yield stream
+    stream.close()
+
+
+def test_pipelined_requests(stream):
+    client = connect(stream)
+    # many requests in flight, RECR ones get no response
+    requests = {}
+    data = b''
+    for request_id in range(100, 200):
+        method = 'RECR' if request_id % 2 else 'RECM'
+        requests[request_id] = bytes('{},d{},p'.format(method, request_id), 'ascii')
+        data += frame(request_id, requests[request_id])
+    client.sendall(data)
+
+    reader = client.makefile('rb')
+    for _ in range(50):
+        request_id, response = read_frame(reader)
+        assert request_id % 2 == 0
+        assert response == b'OK,' + requests[request_id]
+    client.close()
+
+
+def test_connection_is_persistent(stream):
+    client = connect(stream)
+    reader = client.makefile('rb')
+    for request_id in range(3):
+        client.sendall(frame(request_id, b'RECM,d,p'))
+        assert read_frame(reader) == (request_id, b'OK,RECM,d,p')
+    client.close()
+
+
+def test_oversize_frame_closes_connection(stream):
+    client = connect(stream)
+    client.sendall(HEADER.pack(stream.max_size + 1, 1))
+    assert client.recv(1) == b''
+    client.close()
+
+
+def test_client_disconnect(stream):
+    client = connect(stream)
+    # half a frame and gone
+    client.sendall(frame(1, b'RECM,d,p')[:10])
+    client.close()
+
+    # a response to a client that has gone is silently dropped
+    client = connect(stream)
+    client.sendall(frame(2, b'RECR,d,p'))
+    client.close()
+    time.sleep(0.1)
+    stream.echo.responses[-1](b'OK')
+
+    # and the server keeps on serving
+    client = connect(stream)
+    client.sendall(frame(3, b'RECM,d,p'))
+    assert read_frame(client.makefile('rb')) == (3, b'OK,RECM,d,p')
+    client.close()
+
+
+def test_unix_socket_in_use(tmp_path):
+    path = str(tmp_path / 'r.sock')
+    stream, _ = start(socket.AF_UNIX, path)
+    with pytest.raises(Exception, match = 'in use'):
+        StreamSocket(path, None, socket.AF_UNIX).bind()
+    stream.close()
+    assert not os.path.exists(path)
+
+
+def test_stale_unix_socket(tmp_path):
+    path = str(tmp_path / 'r.sock')
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    stream, _ = start(socket.AF_UNIX, path)
+    client = connect(stream)
+    client.sendall(frame(1, b'RECM,d,p'))
+    assert read_frame(client.makefile('rb')) == (1, b'OK,RECM,d,p')
+    client.close()
+    stream.close()
+
+
+def test_unix_socket_bare_filename(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = Server(None, logfile = 'log', pidfile = 'pid', unix_path = 'r.sock')
+    assert server.unix_path == 'r.sock'
+
+
+def test_close_closes_connections(stream):
+    client = connect(stream)
+    reader = client.makefile('rb')
+    client.sendall(frame(1, b'RECM,d,p'))
+    assert read_frame(reader) == (1, b'OK,RECM,d,p')
+    stream.close()
+    assert client.recv(1) == b''
+    client.close()
+
+
+def server_of(tmp_path, dispatcher, **kwargs):
+    server = Server(
+        dispatcher,
+        host = '127.0.0.1',
+        port = 0,
+        logfile = str(tmp_path / 'log'),
+        pidfile = str(tmp_path / 'pid'),
+        **kwargs
+    )
+    # stdout and stderr are left alone
+    server._init_logger = lambda: None
+    return server
+
+
+def test_stop_with_busy_connection(tmp_path):
+    path = str(tmp_path / 'r.sock')
+    server = server_of(tmp_path, lambda server, data, response: response(b'OK'), unix_path = path)
+    Thread(target = server.onstart, daemon = True).start()
+    deadline = time.time() + 5
+    while not server.unix_thread.is_alive() and time.time() < deadline:
+        time.sleep(0.01)
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    def flood():
+        try:
+            while True:
+                client.sendall(frame(1, b'RECM,d,p') * 100)
+        except OSError:
+            pass
+    Thread(target = flood, daemon = True).start()
+    time.sleep(0.1)
+
+    stopper = Thread(target = server.onstop, daemon = True)
+    stopper.start()
+    stopper.join(5)
+    assert not stopper.is_alive()
+    assert not server.dispatcher_thread.is_alive()
+    assert not os.path.exists(path)
+    client.close()
+    server.socket.sock.close()
+
+
+def test_no_requests_after_stop(tmp_path):
+    server = server_of(tmp_path, None)
+    server.dispatch_stream(b'RECM,d,p', None)
+    server.dispatch_admin(b'MEM,,', None)
+    server.dispatch(b'RECM,d,p', None)
+    assert server.queue.qsize() == 0
+
+
+def test_bind_failure_refuses_start(tmp_path):
+    taken = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    taken.bind(('127.0.0.1', 0))
+    taken.listen()
+    shutdowns = []
+    server = server_of(
+        tmp_path,
+        None,
+        tcp_port = taken.getsockname()[1],
+        shutdown = shutdowns.append
+    )
+    with pytest.raises(OSError):
+        server.onstart()
+    assert not server.running
+    assert not server.dispatcher_thread.is_alive()
+    assert shutdowns == [server]
+    server.socket.sock.close()
+    taken.close()
+
+
+def test_unix_socket_in_use_refuses_start(tmp_path):
+    path = str(tmp_path / 'r.sock')
+    stream, _ = start(socket.AF_UNIX, path)
+    server = server_of(tmp_path, None, unix_path = path)
+    with pytest.raises(Exception, match = 'in use'):
+        server.onstart()
+    assert not server.dispatcher_thread.is_alive()
+    # the socket file belongs to the one who listens on it
+    assert os.path.exists(path)
+    server.socket.sock.close()
+    stream.close()
@@ -0,0 +1,92 @@
+import os, random, subprocess, sys
+
+from src.sketch import Trending
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_heavy_hitters():
+    clock = Clock()
+    trending = Trending(top_n = 5, half_life = 1e9, clock = clock)
+    rnd = random.Random(0)
+    for i in range(5000):
+        # d0..d4 are popular, the rest is noise
+        if rnd.random() < 0.5:
+            trending.add('d{}'.format(rnd.randrange(5)))
+        else:
+            trending.add('n{}'.format(rnd.randrange(1000)))
+    assert sorted(trending.trending()) == ['d{}'.format(i) for i in range(5)]
+    assert len(trending.top) == 5
+
+
+def test_order():
+    trending = Trending(top_n = 3, clock = Clock())
+    for document_id, n in [('a', 1), ('b', 3), ('c', 2)]:
+        for _ in range(n):
+            trending.add(document_id)
+    assert trending.trending() == ['b', 'c', 'a']
+
+
+def test_decay():
+    clock = Clock()
+    trending = Trending(top_n = 2, half_life = 10, clock = clock)
+    for _ in range(10):
+        trending.add('old')
+    # ten half-lives later a single visit weighs 1024 old ones
+    clock.now = 100
+    trending.add('new')
+    assert trending.trending() == ['new', 'old']
+
+
+def test_newcomer_replaces_lowest():
+    clock = Clock()
+    trending = Trending(top_n = 2, half_life = 10, clock = clock)
+    trending.add('a')
+    trending.add('a')
+    trending.add('b')
+    clock.now = 20
+    trending.add('c')
+    assert sorted(trending.trending()) == ['a', 'c']
+    assert 'b' not in trending.top
+
+
+def test_heap_stays_bounded():
+    trending = Trending(top_n = 3, clock = Clock())
+    for i in range(1000):
+        trending.add('d{}'.format(i % 7))
+    assert len(trending.heap) <= 2 * trending.top_n
+    assert set(document_id for _, document_id in trending.heap) >= set(trending.top)
+
+
+def test_rescale():
+    clock = Clock()
+    trending = Trending(top_n = 3, half_life = 1, clock = clock)
+    for document_id, n in [('a', 3), ('b', 2), ('c', 1)]:
+        for _ in range(n):
+            trending.add(document_id)
+    # the weight of a visit would be 2 ** 100 by now
+    clock.now = 100
+    trending.add('c')
+    trending.add('c')
+    assert trending.epoch == 100
+    assert max(max(row) for row in trending.rows) < Trending.MAX_WEIGHT
+    # old counts have shrunk to nothing, the latest visits rule
+    assert trending.trending()[0] == 'c'
+    assert trending.top['c'] == 2.0
+
+
+def test_stable_hash():
+    # columns must not depend on the process, sketches get pickled
+    code = 'from src.sketch import Trending; print(Trending()._cols("doc"))'
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cols = set()
+    for seed in ['1', '2']:
+        env = dict(os.environ, PYTHONHASHSEED = seed)
+        cols.add(subprocess.check_output([sys.executable, '-c', code], cwd = root, env = env))
+    assert len(cols) == 1
@@ -0,0 +1,112 @@
+import os, time
+
+import pytest
+
+from src.tenants import Tenants
+
+
+class FakeRNN(object):
+    def __init__(self):
+        self.fits = []
+
+    def fit(self, inputs):
+        self.fits.append(inputs)
+        return 0.0
+
+
+class FakeRecommender(object):
+    """Just as much of Recommender as Tenants and Scheduler use
+    """
+
+    def __init__(self, name, train_workers = 0):
+        self.name = name
+        self.train_workers = train_workers
+        self.trainer = None
+        self.rnn = FakeRNN()
+        self.visits = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['trainer'] = None
+        return state
+
+    def record(self, document_id):
+        self.visits.append(document_id)
+        self.trainer.put([len(self.visits)])
+
+    def send(self, metric, value):
+        pass
+
+
+def wait_for(condition, timeout = 5):
+    started = time.time()
+    while not condition():
+        assert time.time() - started < timeout
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def tenants(tmp_path):
+    def factory(name):
+        if name == 'unknown':
+            raise KeyError(name)
+        return FakeRecommender(name, 2 if name == 'hogwild' else 0)
+    return Tenants(factory, resident_n = 2, swap_dir = str(tmp_path))
+
+
+def test_swap_out_and_in(tenants, tmp_path):
+    a = tenants.get('a')
+    a.record('d1')
+    wait_for(lambda: len(a.rnn.fits) == 1)
+
+    tenants.get('b')
+    tenants.get('c')
+    # a is the least recently used one
+    assert list(tenants.resident) == ['b', 'c']
+    assert os.listdir(str(tmp_path)) == ['a.pickle']
+    assert 'a' not in tenants.scheduler.queues
+
+    a = tenants.get('a')
+    assert a.visits == ['d1']
+    assert a.rnn.fits == [[1]]
+    assert os.listdir(str(tmp_path)) == ['b.pickle']
+    # the training queue is registered again
+    assert tenants.scheduler.queues['a'] is a.trainer
+    a.record('d2')
+    wait_for(lambda: len(a.rnn.fits) == 2)
+
+
+def test_lru_order(tenants):
+    tenants.get('a')
+    tenants.get('b')
+    tenants.get('a')
+    tenants.get('c')
+    assert list(tenants.resident) == ['a', 'c']
+
+
+def test_bad_names(tenants):
+    with pytest.raises(KeyError):
+        tenants.get('../a')
+    with pytest.raises(KeyError):
+        tenants.get('unknown')
+    assert not tenants.resident
+
+
+def test_train_workers_refused(tenants):
+    with pytest.raises(ValueError):
+        tenants.get('hogwild')
+    assert not tenants.resident
+
+
+def test_scheduler_round_robin(tenants):
+    a, b = tenants.get('a'), tenants.get('b')
+    order = []
+    a.rnn.fit = lambda inputs: order.append('a') or 0.0
+    b.rnn.fit = lambda inputs: order.append('b') or 0.0
+    with tenants.scheduler.cond:
+        # both queues are filled before the thread gets a chance
+        for _ in range(3):
+            a.record('d')
+        b.record('d')
+    wait_for(lambda: len(order) == 4)
+    assert order[:2] in (['a', 'b'], ['b', 'a'])
@@ -0,0 +1,51 @@
+from itertools import accumulate
+
+import random
+
+"""Key streams for ARC cache and Person history tests and benchmarks
+
+Every generator takes a number of distinct keys n_keys, a stream length n
+and a seed, and returns a list of str keys
+"""
+
+def zipf(n_keys, n, seed = 0, s = 1.1):
+    """Skewed popularity: key k is requested with probability proportional to 1 / k ** s
+    """
+    rnd = random.Random(seed)
+    cum_weights = list(accumulate(1 / (k ** s) for k in range(1, n_keys + 1)))
+    return ['k{}'.format(k) for k in rnd.choices(range(n_keys), cum_weights = cum_weights, k = n)]
+
+def scan(n_keys, n, seed = 0, scan_length = 500):
+    """Zipfian requests interleaved with long scans of keys that are never seen again
+    """
+    rnd = random.Random(seed)
+    hot = zipf(n_keys, n, seed)
+    keys, i, fresh = [], 0, 0
+    while len(keys) < n:
+        if rnd.random() < 0.01:
+            for _ in range(scan_length):
+                keys.append('s{}'.format(fresh))
+                fresh += 1
+        else:
+            keys.append(hot[i])
+            i += 1
+    return keys[:n]
+
+def loop(n_keys, n, seed = 0):
+    """The same n_keys keys requested over and over in the same order
+        with an occasional random request in between
+    """
+    rnd = random.Random(seed)
+    keys = []
+    for i in range(n):
+        if rnd.random() < 0.05:
+            keys.append('k{}'.format(rnd.randrange(n_keys)))
+        else:
+            keys.append('k{}'.format(i % n_keys))
+    return keys
+
+WORKLOADS = {
+    'zipf': zipf,
+    'scan': scan,
+    'loop': loop,
+}